@@ -2,32 +2,38 @@ import asyncio
 from telegram.ext import ApplicationBuilder
 from config import BOT_TOKEN
 from plugins.connections.logger import setup_logger
-from plugins.connections.db import init_db
+from plugins.connections.db import init_db, pool
 from plugins.utils.cleanup import clean_temp_job
-from datetime import timedelta
-import aioschedule
+from datetime import timedelta, time as dt_time
 
 from plugins.game.db import reset_daily_leaderboard  # your reset function
 
 logger = setup_logger("mind-scale-bot")
 
-async def start_scheduler():
-    """Runs scheduled background jobs."""
-    # Wrap sync function in async-safe thread
-    aioschedule.every().day.at("00:00").do(
-        lambda: asyncio.create_task(asyncio.to_thread(reset_daily_leaderboard))
-    )
+async def reset_daily_job(context):
+    """Midnight reset of the daily leaderboard, run off the event loop."""
+    await asyncio.to_thread(reset_daily_leaderboard)
+
+async def on_startup(app):
+    """Runs inside the application's event loop once the bot is initialized."""
+    logger.info("✅ Bot is running...")
 
-    while True:
-        await aioschedule.run_pending()
-        await asyncio.sleep(30)
+async def on_shutdown(app):
+    """Close pooled SQLite connections so the WAL is checkpointed on exit."""
+    pool.close()
 
 
 if __name__ == "__main__":
     # Init DB
     init_db()
 
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
     # Load Game module
     try:
@@ -50,9 +56,7 @@ if __name__ == "__main__":
         first=300  # 5 minutes
     )
 
-    # Run the async scheduler in background
-    loop = asyncio.get_event_loop()
-    loop.create_task(start_scheduler())
+    # Reset the daily leaderboard every midnight (UTC)
+    app.job_queue.run_daily(reset_daily_job, time=dt_time(0, 0))
 
-    print("✅ Bot is running...")
     app.run_polling()
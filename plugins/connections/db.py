@@ -1,12 +1,189 @@
 # plugins/connections/db.py
+import asyncio
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
 from telegram import Chat
 from config import DB_PATH
 
+POOL_SIZE = 8
+# Prepared statements kept per connection, keyed by SQL text
+STATEMENT_CACHE_SIZE = 256
+
+# Connection shared by every helper running inside the current handler
+_ctx_conn: ContextVar[sqlite3.Connection | None] = ContextVar("db_conn", default=None)
+
+
+def init_connection(conn: sqlite3.Connection, readonly: bool = True):
+    """Per-connection setup, run once when the pool opens a connection."""
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    if readonly:
+        conn.execute("PRAGMA busy_timeout=2000")
+    else:
+        conn.execute("PRAGMA wal_autocheckpoint=1000")
+
+
+class SQLitePool:
+    """
+    Bounded pool of pre-opened read connections plus one dedicated writer.
+    Connections are opened lazily on first use and then reused forever.
+    Readers are opened read-only so, with WAL, they never block the writer.
+    """
+
+    def __init__(self, path: str, size: int = POOL_SIZE, timeout: float = 10):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._readers: queue.Queue[sqlite3.Connection] = queue.Queue(maxsize=size)
+        self._writer: queue.Queue[sqlite3.Connection] = queue.Queue(maxsize=1)
+        self._lock = threading.Lock()
+        self._opened = False
+
+    def _open(self, readonly: bool) -> sqlite3.Connection:
+        if readonly:
+            conn = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True, timeout=5,
+                check_same_thread=False, isolation_level=None,
+                cached_statements=STATEMENT_CACHE_SIZE,
+            )
+        else:
+            conn = sqlite3.connect(
+                self.path, timeout=10, check_same_thread=False, isolation_level=None,
+                cached_statements=STATEMENT_CACHE_SIZE,
+            )
+        init_connection(conn, readonly)
+        return conn
+
+    def _ensure_open(self):
+        if self._opened:
+            return
+        with self._lock:
+            if self._opened:
+                return
+            self._writer.put(self._open(readonly=False))
+            for _ in range(self.size):
+                self._readers.put(self._open(readonly=True))
+            self._opened = True
+
+    def checkout(self, readonly: bool = True) -> sqlite3.Connection:
+        """Take a connection out of the pool; blocks until one is free."""
+        self._ensure_open()
+        q = self._readers if readonly else self._writer
+        try:
+            return q.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"no pooled connection free after {self.timeout}s"
+            ) from None
+
+    def checkin(self, conn: sqlite3.Connection, readonly: bool = True):
+        (self._readers if readonly else self._writer).put(conn)
+
+    @contextmanager
+    def acquire(self, readonly: bool = True):
+        """Check a connection out of the pool and return it when the block exits."""
+        conn = self.checkout(readonly)
+        try:
+            yield conn
+        finally:
+            self.checkin(conn, readonly)
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Hold every pooled connection, waiting for in-flight users to hand
+        theirs back, so nothing reads through the pool while the block runs.
+        """
+        held = [(self.checkout(readonly=False), False)]
+        try:
+            for _ in range(self.size):
+                held.append((self.checkout(), True))
+            yield
+        finally:
+            for conn, readonly in held:
+                self.checkin(conn, readonly)
+
+    def close(self):
+        with self._lock:
+            for q in (self._readers, self._writer):
+                while not q.empty():
+                    q.get_nowait().close()
+            self._opened = False
+
+
+pool = SQLitePool(DB_PATH)
+_session_slots = asyncio.Semaphore(POOL_SIZE)
+
+
+@asynccontextmanager
+async def db_session():
+    """
+    Check one read connection out for the whole handler. Helpers called
+    inside the block (including via asyncio.to_thread, which copies the
+    context) pick it up through get_conn() instead of reconnecting.
+    """
+    conn = _ctx_conn.get()
+    if conn is not None:
+        yield conn
+        return
+
+    # Wait for a session slot on the loop, not in an executor thread:
+    # sessions blocked in the executor would starve the queries that free
+    # them up. A slot doesn't guarantee a free reader, since plain get_conn()
+    # callers share the pool, so the checkout itself runs off the loop. Those
+    # callers are already running in a thread and give theirs back promptly.
+    async with _session_slots:
+        conn = await asyncio.to_thread(pool.checkout)
+        token = _ctx_conn.set(conn)
+        try:
+            yield conn
+        finally:
+            _ctx_conn.reset(token)
+            pool.checkin(conn)
+
+
+@contextmanager
+def get_conn(readonly: bool = True):
+    """Yield the handler's session connection, or a pooled one outside a session."""
+    conn = _ctx_conn.get()
+    if conn is not None and readonly:
+        yield conn
+        return
+
+    with pool.acquire(readonly) as conn:
+        yield conn
+
+
+@contextmanager
+def transaction():
+    """
+    Hold the writer inside BEGIN IMMEDIATE, so a check and the write that
+    depends on it can't interleave with another writer. Commits on exit,
+    rolls back if the block raises.
+    """
+    with pool.acquire(readonly=False) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
 def init_db():
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
 
+    # WAL is persistent: readers stop blocking the writer from here on
+    c.execute("PRAGMA journal_mode=WAL")
+
     # Users table
     c.execute(
         """
@@ -27,6 +204,44 @@ def init_db():
     """
     )
 
+    # Columns added after the table was first created; checked once here
+    # rather than on every game end
+    required_columns = {
+        "games_played": "INTEGER DEFAULT 0",
+        "wins": "INTEGER DEFAULT 0",
+        "losses": "INTEGER DEFAULT 0",
+        "rounds_played": "INTEGER DEFAULT 0",
+        "eliminations": "INTEGER DEFAULT 0",
+        "total_score": "INTEGER DEFAULT 0",
+        "last_score": "INTEGER DEFAULT 0",
+        "penalties": "INTEGER DEFAULT 0"
+    }
+    c.execute("PRAGMA table_info(users)")
+    existing_columns = [col[1] for col in c.fetchall()]
+    for col, col_type in required_columns.items():
+        if col not in existing_columns:
+            c.execute(f"ALTER TABLE users ADD COLUMN {col} {col_type}")
+
+    # Win % computed by SQLite instead of per row in Python.
+    # ALTER TABLE can't add STORED generated columns, so this one is VIRTUAL.
+    c.execute("PRAGMA table_xinfo(users)")
+    if "win_percent" not in [col[1] for col in c.fetchall()]:
+        c.execute(
+            """
+            ALTER TABLE users ADD COLUMN win_percent REAL GENERATED ALWAYS AS (
+                CASE WHEN games_played > 0
+                     THEN ROUND(CAST(IFNULL(wins, 0) AS REAL) / games_played * 100, 1)
+                     ELSE 0 END
+            ) VIRTUAL
+            """
+        )
+
+    # Leaderboard ORDER BY wins DESC, total_score DESC walks this index
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_rank ON users(wins DESC, total_score DESC, user_id)"
+    )
+    c.execute("ANALYZE users")
+
     # Groups table
     c.execute(
         """
@@ -41,6 +256,12 @@ def init_db():
     """
     )
 
+    # /stats "most active group" (ORDER BY games_played DESC LIMIT 1)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_groups_games_played ON groups(games_played DESC)"
+    )
+    c.execute("ANALYZE groups")
+
     conn.commit()
     conn.close()
 
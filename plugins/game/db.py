@@ -1,6 +1,8 @@
 import sqlite3
 from typing import Any
 from config import DB_PATH
+from plugins.connections.db import get_conn
+from plugins.utils.lb_cache import cached, invalidate_leaderboard
 import logging
 
 logger = logging.getLogger(__name__)
@@ -99,7 +101,6 @@ def ensure_user_exists(user: Any):
 
 def update_user_after_game(user_id: int, score_delta: int, won: bool, rounds_played: int, eliminated: bool, penalties: int):
     conn = sqlite3.connect(DB_PATH)
-    ensure_columns_exist()
     c = conn.cursor()
     c.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
     if not c.fetchone():
@@ -124,36 +125,12 @@ def update_user_after_game(user_id: int, score_delta: int, won: bool, rounds_pla
         logger.exception("Failed to update user after game")
     conn.commit()
     conn.close()
-
-def ensure_columns_exist():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    required_columns = {
-        "games_played": "INTEGER DEFAULT 0",
-        "wins": "INTEGER DEFAULT 0",
-        "losses": "INTEGER DEFAULT 0",
-        "rounds_played": "INTEGER DEFAULT 0",
-        "eliminations": "INTEGER DEFAULT 0",
-        "total_score": "INTEGER DEFAULT 0",
-        "last_score": "INTEGER DEFAULT 0",
-        "penalties": "INTEGER DEFAULT 0"
-    }
-    c.execute("PRAGMA table_info(users)")
-    existing_columns = [col[1] for col in c.fetchall()]
-    for col, col_type in required_columns.items():
-        if col not in existing_columns:
-            try:
-                c.execute(f"ALTER TABLE users ADD COLUMN {col} {col_type}")
-            except Exception:
-                logger.exception("Failed to add column %s", col)
-    conn.commit()
-    conn.close()
+    invalidate_leaderboard()
 
 # ----- Individual Group Stats -----------
 
 def ensure_gstats_tables():
     conn = sqlite3.connect(DB_PATH, timeout=10)
-    ensure_columns_exist()
     c = conn.cursor()
     # Per-group, per-user rollups
     c.execute("""
@@ -263,7 +240,6 @@ def record_group_game_end(
 
 def ensure_games_table():
     conn = sqlite3.connect(DB_PATH, timeout=10)
-    ensure_columns_exist()
     c = conn.cursor()
     c.execute("""
         CREATE TABLE IF NOT EXISTS games (
@@ -319,6 +295,7 @@ def update_daily_stats(user_id: int, first_name: str, username: str, score_delta
                 updated_at   = CURRENT_TIMESTAMP
         """, (user_id, first_name, username, 1 if won else 0, score_delta))
         conn.commit()
+        invalidate_leaderboard()
     except Exception:
         logger.exception("Failed to update daily stats for user %s", user_id)
     finally:
@@ -327,14 +304,15 @@ def update_daily_stats(user_id: int, first_name: str, username: str, score_delta
 import sqlite3
 from config import DB_PATH
 
-def get_daily_leaderboard(limit: int = 100):
-    """
-    Returns a list of daily stats sorted by wins then total_score.
-    Each item is a dict like overall leaderboard.
-    """
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+@cached(lambda limit: ("daily_count", limit), ttl=30)
+def _count_daily_users(limit: int):
+    with get_conn() as conn:
+        return min(conn.execute("SELECT COUNT(*) FROM daily_stats").fetchone()[0], limit)
+
+
+@cached(lambda offset, limit: ("daily", offset, limit), ttl=30)
+def _query_daily_page(offset: int, limit: int):
+    with get_conn() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             SELECT 
@@ -344,22 +322,76 @@ def get_daily_leaderboard(limit: int = 100):
                 IFNULL(games_played, 0) AS games_played,
                 IFNULL(wins, 0) AS wins,
                 0 AS losses,  -- daily losses not tracked
-                0 AS rounds_played,
-                0 AS eliminations,
                 IFNULL(total_score, 0) AS total_score,
-                0 AS penalties
+                0 AS penalties,
+                CASE WHEN games_played > 0
+                     THEN ROUND(CAST(wins AS REAL) / games_played * 100, 1)
+                     ELSE 0 END AS win_percent
             FROM daily_stats
-            ORDER BY wins DESC, total_score DESC
-            LIMIT ?
-        """, (limit,))
-        result = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return result
-    except Exception as e:
-        print("Error fetching daily leaderboard:", e)
+            ORDER BY daily_stats.wins DESC, daily_stats.total_score DESC, daily_stats.user_id
+            LIMIT ? OFFSET ?
+        """, (limit, offset))
+        return cursor.fetchall()
+
+
+def count_daily_users(limit: int = 100) -> int:
+    """Number of players on today's leaderboard, capped at `limit`."""
+    try:
+        return _count_daily_users(limit)
+    except Exception:
+        logger.exception("Error counting daily leaderboard")
+        return 0
+
+
+def get_daily_page(offset: int, limit: int):
+    """One page of daily stats sorted by wins then total_score."""
+    try:
+        return _query_daily_page(offset, limit)
+    except Exception:
+        logger.exception("Error fetching daily leaderboard")
         return []
 
 
+def get_daily_leaderboard(limit: int = 100):
+    """
+    Returns a list of daily stats sorted by wins then total_score.
+    Each item is a dict like overall leaderboard.
+    """
+    return get_daily_page(0, limit)
+
+
+def get_daily_rank_sql(conn, user_id: int):
+    """Return the user's daily row with its daily rank, or None."""
+    try:
+        cursor = conn.execute("""
+            WITH ranked AS (
+                SELECT
+                    user_id,
+                    IFNULL(username, '') AS username,
+                    IFNULL(first_name, '') AS first_name,
+                    IFNULL(games_played, 0) AS games_played,
+                    IFNULL(wins, 0) AS wins,
+                    0 AS losses,  -- daily losses not tracked
+                    IFNULL(total_score, 0) AS total_score,
+                    0 AS penalties,
+                    CASE WHEN games_played > 0
+                         THEN ROUND(CAST(wins AS REAL) / games_played * 100, 1)
+                         ELSE 0 END AS win_percent,
+                    ROW_NUMBER() OVER (
+                        ORDER BY daily_stats.wins DESC, daily_stats.total_score DESC,
+                                 daily_stats.user_id
+                    ) AS rnk,
+                    COUNT(*) OVER () AS total_users
+                FROM daily_stats
+            )
+            SELECT * FROM ranked WHERE user_id = ?
+        """, (user_id,))
+        return cursor.fetchone()
+    except sqlite3.Error:
+        logger.exception("Failed to fetch daily rank for user %s", user_id)
+        return None
+
+
 def reset_daily_leaderboard():
     """Clear daily leaderboard — called at midnight."""
     ensure_daily_table()
@@ -368,6 +400,7 @@ def reset_daily_leaderboard():
         c = conn.cursor()
         c.execute("DELETE FROM daily_stats")
         conn.commit()
+        invalidate_leaderboard()
         logger.info("🌙 Daily leaderboard reset completed.")
     except Exception as e:
         logger.exception(f"Failed to reset daily leaderboard: {e}")
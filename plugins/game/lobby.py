@@ -2,7 +2,7 @@ import asyncio
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes, filters
 from plugins.game.core import MindScaleGame, active_games, user_active_game, start_round, mention_html
-from plugins.game.db import ensure_user_exists, ensure_group_exists, ensure_columns_exist, update_user_after_game
+from plugins.game.db import ensure_user_exists, ensure_group_exists, update_user_after_game
 from config import JOIN_TIME_SEC, MIN_PLAYERS, MAX_PLAYERS
 from plugins.helpers.leaderboard import get_user_rank
 from plugins.utils.decorators import admin_only, mod_or_owner
@@ -1,11 +1,16 @@
 import os
-import shutil
+import asyncio
+import sqlite3
 import logging
 import glob, re
 from datetime import datetime, timedelta
 from telegram import Update, InputFile
 from telegram.ext import ContextTypes, CommandHandler
 from plugins.utils.decorators import owner_only, mod_or_owner
+from plugins.utils.mods_auth import reload_mods
+from plugins.helpers.stats import invalidate_stats
+from plugins.utils.lb_cache import invalidate_leaderboard
+from plugins.connections.db import init_db, pool
 
 from config import DB_PATH, OWNER_ID, BACKUP_FOLDER, LOG_CHAT_ID
 
@@ -30,13 +35,39 @@ def _ensure_backups_dir():
         logger.error(f"Failed to ensure backups dir: {e}")
 
 
+def _copy_db(src_path: str, dst_path: str):
+    """
+    Copy one SQLite database into another with the online backup API.
+    Unlike a plain file copy this includes pages still sitting in the
+    -wal file and never catches the source halfway through a write.
+    """
+    src = sqlite3.connect(src_path)
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def _restore_db(src_path: str):
+    """
+    Replace DB_PATH's contents with the backup at src_path. The pool is held
+    throughout so no pooled reader sees the database mid-replace; init_db()
+    re-adds columns and indexes older backups lack.
+    """
+    with pool.exclusive():
+        _copy_db(src_path, DB_PATH)
+        init_db()
+
+
 async def _create_backup_file(prefix: str) -> str:
     """
     Create a copy of DB_PATH into backups/ and return the file path.
     """
     _ensure_backups_dir()
     dst = _backup_path(prefix)
-    shutil.copyfile(DB_PATH, dst)
+    await asyncio.to_thread(_copy_db, DB_PATH, dst)
     return dst
 
 
@@ -99,7 +130,10 @@ async def restore_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             logger.warning(f"Could not create pre-restore backup: {e}")
 
-        shutil.copyfile(temp_restore_path, DB_PATH)
+        await asyncio.to_thread(_restore_db, temp_restore_path)
+        reload_mods()
+        invalidate_leaderboard()
+        invalidate_stats()
 
         await update.message.reply_text("✅ Database restored successfully!")
     except Exception as e:
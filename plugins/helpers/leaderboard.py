@@ -5,20 +5,28 @@ import logging
 import sqlite3
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, User
 from telegram.ext import ContextTypes
-from config import DB_PATH
-from plugins.game.db import ensure_columns_exist, get_daily_leaderboard
-from plugins.utils.thumbnail import generate_card, download_user_photo_by_id
+from config import Load_id  # file_id of the loading sticker
+from plugins.connections.db import db_session, get_conn
+from plugins.game.db import count_daily_users, get_daily_page, get_daily_rank_sql
+from plugins.utils.thumbnail import (
+    card_photo, remember_card_file_id, forget_card_file_id, download_user_photo_by_id
+)
+from plugins.utils.lb_cache import cached
 
 logger = logging.getLogger(__name__)
 
 PER_PAGE = 5
+LEADERBOARD_LIMIT = 100
 
 # ---------------- DB ----------------
-def get_all_users_sorted(limit: int = 100):
-    try:
-        ensure_columns_exist()
-        conn = sqlite3.connect(DB_PATH, timeout=10)
-        conn.row_factory = sqlite3.Row
+@cached(lambda: ("count",), ttl=30)
+def _count_users():
+    with get_conn() as conn:
+        return min(conn.execute("SELECT COUNT(*) FROM users").fetchone()[0], LEADERBOARD_LIMIT)
+
+@cached(lambda offset, limit: ("all", offset, limit), ttl=30)
+def _query_users_page(offset: int, limit: int):
+    with get_conn() as conn:
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -29,48 +37,96 @@ def get_all_users_sorted(limit: int = 100):
                 IFNULL(games_played, 0) AS games_played, 
                 IFNULL(wins, 0) AS wins, 
                 IFNULL(losses, 0) AS losses, 
-                IFNULL(rounds_played, 0) AS rounds_played, 
-                IFNULL(eliminations, 0) AS eliminations, 
                 IFNULL(total_score, 0) AS total_score, 
-                IFNULL(penalties, 0) AS penalties
+                IFNULL(penalties, 0) AS penalties,
+                win_percent
             FROM users
-            ORDER BY wins DESC, total_score DESC
-            LIMIT ?
+            ORDER BY users.wins DESC, users.total_score DESC, users.user_id
+            LIMIT ? OFFSET ?
             """,
-            (limit,),
+            (limit, offset),
         )
-        result = cursor.fetchall()
-        conn.close()
-        return result
+        return cursor.fetchall()
+
+def count_users() -> int:
+    """Number of players shown on the leaderboard (capped at LEADERBOARD_LIMIT)."""
+    try:
+        return _count_users()
     except Exception:
-        logger.exception("Error in get_all_users_sorted")
+        logger.exception("Error in count_users")
+        return 0
+
+def get_users_page(offset: int, limit: int):
+    try:
+        return _query_users_page(offset, limit)
+    except Exception:
+        logger.exception("Error in get_users_page")
         return []
 
+def _user_rank_row(conn, user_id):
+    """The user's row with its overall rank and the user count; None if not registered."""
+    # Both windows share one ordering, which walks idx_users_rank without a sort
+    cursor = conn.execute(
+        """
+        WITH ranked AS (
+            SELECT
+                user_id,
+                IFNULL(username, '') AS username,
+                IFNULL(first_name, '') AS first_name,
+                IFNULL(games_played, 0) AS games_played,
+                IFNULL(wins, 0) AS wins,
+                IFNULL(losses, 0) AS losses,
+                IFNULL(total_score, 0) AS total_score,
+                IFNULL(penalties, 0) AS penalties,
+                IFNULL(rounds_played, 0) AS rounds_played,
+                IFNULL(eliminations, 0) AS eliminations,
+                win_percent,
+                ROW_NUMBER() OVER w AS rnk,
+                COUNT(*) OVER (w ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS total_users
+            FROM users
+            WINDOW w AS (ORDER BY users.wins DESC, users.total_score DESC, users.user_id)
+        )
+        SELECT * FROM ranked WHERE user_id = ?
+        """,
+        (user_id,),
+    )
+    return cursor.fetchone()
+
+def get_user_rank_sql(conn, user_id):
+    """Return the user's row with its overall rank and the user count, or None."""
+    try:
+        return _user_rank_row(conn, user_id)
+    except sqlite3.Error:
+        logger.exception("Failed to fetch rank for user %s", user_id)
+        return None
+
 def get_user_rank(user_id):
     try:
-        all_users = get_all_users_sorted()
-        for idx, row in enumerate(all_users, start=1):
-            if row['user_id'] == user_id:
+        with get_conn() as conn:
+            # Not the None-on-error wrapper: a failed query must reach the
+            # error fallback below, not read as "not registered"
+            row = _user_rank_row(conn, user_id)
+            if row:
                 gp = row['games_played'] or 0
-                win_percent = round((row['wins'] or 0) / gp * 100, 1) if gp > 0 else 0
                 return {
                     "username": (row['username'] or row['first_name'] or "Unknown"),
-                    "rank": idx,
-                    "total_users": len(all_users),
+                    "rank": row['rnk'],
+                    "total_users": row['total_users'],
                     "total_played": gp,
                     "wins": row['wins'] or 0,
                     "losses": row['losses'] or 0,
-                    "win_percent": win_percent,
+                    "win_percent": _win_pct(row),
                     "rounds_played": row['rounds_played'] or 0,
                     "eliminations": row['eliminations'] or 0,
                     "total_score": row['total_score'] or 0,
                     "penalties": row['penalties'] or 0
                 }
-        # Not in list
+            # Not registered yet
+            total_users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
         return {
             "username": "Unknown",
-            "rank": len(all_users) + 1,
-            "total_users": len(all_users),
+            "rank": total_users + 1,
+            "total_users": total_users,
             "total_played": 0,
             "wins": 0,
             "losses": 0,
@@ -88,11 +144,63 @@ def get_user_rank(user_id):
             "eliminations": 0, "total_score": 0, "penalties": 0
         }
 
+# ---------------- Templates ----------------
+_ROW_FMT = (
+    "{rank}. {medal} {highlight}<b>{name}</b> (ID: {uid})\n"
+    "   🎮 Games: {gp} | ⧉ Win%: {wp}\n"
+    "   🏆 Wins: {w} | Lost: {l}\n"
+    "   ⭐ Score: {s} | ⛔ Pen: {p}\n"
+    "<b>────⊱◈◈◈⊰────</b>\n\n"
+)
+
+_YOUR_RANK_FMT = (
+    "\n\n<b>────⊱◈◈◈⊰────</b>\n"
+    "📌 <b>Your Rank:</b>\n"
+    "{rank}. {name} (ID: {uid})\n"
+    "   🎮 Games: {gp} | ⧉ Win%: {wp}\n"
+    "   🏆 Wins: {w} | Lost: {l}\n"
+    "   ⭐ Score: {s} | ⛔ Pen: {p}\n"
+)
+
+_USERINFO_FMT = """
+╭━━━ ⟢ 𝗢𝘃𝗲𝗿𝗮𝗹𝗹 𝗦𝘁𝗮𝘁𝘀 ⟢ ━━━╮
+┃ 👤 <b>{name}</b>
+╰━━━━━━━━━━━━━━━━━━━╯
+🏆 𝐑𝐚𝐧𝐤: {rank}
+🎮 Games Played: {total_played}
+🥇 Wins: {wins} | Losses: {losses}
+📊 Win %: {win_percent:.2f}%
+⭐ Total Score: {total_score}
+⛔ Penalties: {penalties}
+━━━━━━━━━━━━━━━━━━━━━
+💡 <i>One match doesn’t define you — the comeback will! 🚀</i>
+"""
+
+_DAILY_STATS_FMT = """
+╭━━━ ⟢ 𝗗𝗮𝗶𝗹𝘆 𝗦𝘁𝗮𝘁𝘀 ⟢ ━━━╮
+🏆 Daily Rank: {rank}
+🎮 Games: {games}
+🥇 Wins: {wins} | Losses: {losses}
+📊 Win %: {win_pct}%
+⭐ Score: {score} | ⛔ Penalties: {pen}
+━━━━━━━━━━━━━━━━━━━━━
+💡 Daily stats keep you motivated! 🚀
+"""
+
+_OVERALL_STATS_FMT = """
+╭━━━ ⟢ 𝗢𝘃𝗲𝗿𝗮𝗹𝗹 𝗦𝘁𝗮𝘁𝘀 ⟢ ━━━╮
+🏆 Rank: {rank}
+🎮 Games Played: {total_played}
+🥇 Wins: {wins} | Losses: {losses}
+📊 Win %: {win_percent:.2f}%
+⭐ Total Score: {total_score} | ⛔ Penalties: {penalties}
+━━━━━━━━━━━━━━━━━━━━━
+💡 Track your progress over time! 🚀
+"""
+
 # ---------------- UI helpers ----------------
 def _medal_for_rank(rank: int) -> str:
     return {1: "🥇", 2: "🥈", 3: "🥉"}.get(rank, "")
-    
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 def _build_pager_old(page: int, total_pages: int, prefix: str) -> InlineKeyboardMarkup | None:
     """
@@ -126,91 +234,109 @@ def _build_pager_old(page: int, total_pages: int, prefix: str) -> InlineKeyboard
 
     return InlineKeyboardMarkup(buttons)
 
-def _build_leaderboard_text(all_users, page: int, per_page: int, viewer_id: int, daily: bool = False):
-    total = len(all_users)
+def _clamp_page(page: int, total: int, per_page: int):
     total_pages = max(1, math.ceil(total / per_page))
-    page = max(1, min(page, total_pages))
+    return max(1, min(page, total_pages)), total_pages
+
+def _fetch_leaderboard_page(page: int, viewer_id: int, daily: bool = False):
+    """
+    Fetch only the rows for `page`, plus the viewer's own ranked row when
+    the viewer isn't on that page. Returns (rows, total, page, viewer_row).
+    """
+    with get_conn() as conn:
+        if daily:
+            total = count_daily_users(LEADERBOARD_LIMIT)
+        else:
+            total = count_users()
+        page, _ = _clamp_page(page, total, PER_PAGE)
+        offset = (page - 1) * PER_PAGE
+        rows = get_daily_page(offset, PER_PAGE) if daily else get_users_page(offset, PER_PAGE)
+
+        viewer_row = None
+        if not any(row['user_id'] == viewer_id for row in rows):
+            rank_sql = get_daily_rank_sql if daily else get_user_rank_sql
+            viewer_row = rank_sql(conn, viewer_id)
+    return rows, total, page, viewer_row
+
+def _win_pct(row):
+    """Win % for a board row; users.win_percent is REAL, so 0 games reads back as 0.0."""
+    return row['win_percent'] if row['games_played'] else 0
+
+def _build_leaderboard_text(rows, total: int, page: int, per_page: int, viewer_id: int, viewer_row=None, daily: bool = False):
+    page, total_pages = _clamp_page(page, total, per_page)
     start_idx = (page - 1) * per_page
-    end_idx = min(start_idx + per_page, total)
 
-    text = "<b>──✦ Player Spotlight ✦──</b>\n\n"
+    parts = ["<b>──✦ Player Spotlight ✦──</b>\n\n"]
     user_in_page = False
 
-    for i, row in enumerate(all_users[start_idx:end_idx], start=start_idx + 1):
-        rank = i
-        medal = _medal_for_rank(rank)
-        gp = row['games_played'] or 0
-        wins = row['wins'] or 0
-        losses = row['losses'] or 0
-        total_score = row['total_score'] or 0
-        penalties = row['penalties'] or 0
-        win_percent = round(wins / gp * 100, 1) if gp > 0 else 0
-        display_name = html.escape(row['first_name'] or row['username'] or "Unknown")
-        highlight = "⭐ " if row['user_id'] == viewer_id else ""
-
-        text += f"{rank}. {medal} {highlight}<b>{display_name}</b> (ID: {row['user_id']})\n"
-        text += f"   🎮 Games: {gp} | ⧉ Win%: {win_percent}\n"
-        text += f"   🏆 Wins: {wins} | Lost: {losses}\n"
-        text += f"   ⭐ Score: {total_score} | ⛔ Pen: {penalties}\n"
-        text += "<b>────⊱◈◈◈⊰────</b>\n\n"
+    for rank, row in enumerate(rows, start=start_idx + 1):
+        parts.append(_ROW_FMT.format_map({
+            "rank": rank,
+            "medal": _medal_for_rank(rank),
+            "highlight": "⭐ " if row['user_id'] == viewer_id else "",
+            "name": html.escape(row['first_name'] or row['username'] or "Unknown"),
+            "uid": row['user_id'],
+            "gp": row['games_played'] or 0,
+            "wp": _win_pct(row),
+            "w": row['wins'] or 0,
+            "l": row['losses'] or 0,
+            "s": row['total_score'] or 0,
+            "p": row['penalties'] or 0,
+        }))
 
         if row['user_id'] == viewer_id:
             user_in_page = True
 
     if not user_in_page:
-        me_row = next((row for row in all_users if row['user_id'] == viewer_id), None)
-        if me_row:
-            rank = next((idx for idx, r in enumerate(all_users, 1) if r['user_id'] == viewer_id), total + 1)
+        if viewer_row:
             me = {
-                "username": me_row['username'] or me_row['first_name'] or "Unknown",
-                "rank": rank,
-                "games_played": me_row['games_played'] or 0,
-                "wins": me_row['wins'] or 0,
-                "losses": me_row['losses'] or 0,
-                "total_score": me_row['total_score'] or 0,
-                "penalties": me_row['penalties'] or 0
+                "name": html.escape(viewer_row['username'] or viewer_row['first_name'] or "Unknown"),
+                "rank": viewer_row['rnk'],
+                "gp": viewer_row['games_played'] or 0,
+                "wp": _win_pct(viewer_row),
+                "w": viewer_row['wins'] or 0,
+                "l": viewer_row['losses'] or 0,
+                "s": viewer_row['total_score'] or 0,
+                "p": viewer_row['penalties'] or 0,
             }
         else:
-            me = {
-                "username": "Unknown",
-                "rank": total + 1,
-                "games_played": 0,
-                "wins": 0,
-                "losses": 0,
-                "total_score": 0,
-                "penalties": 0
-            }
+            me = {"name": "Unknown", "rank": total + 1, "gp": 0, "wp": 0, "w": 0, "l": 0, "s": 0, "p": 0}
+        me["uid"] = viewer_id
 
-        text += f"\n\n<b>────⊱◈◈◈⊰────</b>\n"
-        text += "📌 <b>Your Rank:</b>\n"
-        text += f"{me['rank']}. {html.escape(me['username'])} (ID: {viewer_id})\n"
-        text += f"   🎮 Games: {me['games_played']} | ⧉ Win%: {round(me['wins']/me['games_played']*100,1) if me['games_played'] else 0}\n"
-        text += f"   🏆 Wins: {me['wins']} | Lost: {me['losses']}\n"
-        text += f"   ⭐ Score: {me['total_score']} | ⛔ Pen: {me['penalties']}\n"
+        parts.append(_YOUR_RANK_FMT.format_map(me))
 
-    return text, total_pages, page
+    return "".join(parts), total_pages, page
 
-async def _send_leaderboard_initial(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    viewer_id = update.effective_user.id
+async def _send_loading(update: Update, fallback_text: str):
+    """Send the loading sticker, or a text placeholder if the sticker fails."""
+    try:
+        return await update.message.reply_sticker(Load_id)
+    except Exception:
+        return await update.message.reply_text(fallback_text)
 
-    # Send loading sticker first
+async def _download_photo(user_id: int, bot):
     try:
-        mystic = await update.message.reply_sticker(Load_id)
+        return await download_user_photo_by_id(user_id, bot)
     except Exception:
-        mystic = await update.message.reply_text("⏳ Loading leaderboard...")
+        logger.exception("Failed to download user photo; using default card background.")
+        return None
 
-    all_users = get_all_users_sorted()
+async def _send_leaderboard_initial(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    viewer_id = update.effective_user.id
+
+    # Loading sticker goes out while the page is read from the DB
+    loading = asyncio.create_task(_send_loading(update, "⏳ Loading leaderboard..."))
+
+    async with db_session():
+        rows, total, page, viewer_row = await asyncio.to_thread(_fetch_leaderboard_page, 1, viewer_id)
     text, total_pages, page = _build_leaderboard_text(
-        all_users, page=1, per_page=PER_PAGE, viewer_id=viewer_id
+        rows, total, page=page, per_page=PER_PAGE, viewer_id=viewer_id, viewer_row=viewer_row
     )
 
     pager = _build_pager_old(page, total_pages, prefix="leaderboard")
 
-    top_user_id = all_users[0]['user_id'] if all_users else viewer_id
-    try:
-        usr_pfp_path = await download_user_photo_by_id(top_user_id, context.bot)
-    except Exception:
-        usr_pfp_path = None
+    top_user_id = rows[0]['user_id'] if rows else viewer_id
+    mystic, usr_pfp_path = await asyncio.gather(loading, _download_photo(top_user_id, context.bot))
 
     # Delete the loading sticker/message
     try:
@@ -218,19 +344,23 @@ async def _send_leaderboard_initial(update: Update, context: ContextTypes.DEFAUL
     except Exception:
         pass
 
+    card_key = None
     try:
-        card = generate_card("leaderboard", usr_pfp_path)
-        await update.message.reply_photo(photo=card, caption=text, reply_markup=pager, parse_mode="HTML")
+        card_key, card = card_photo("leaderboard", usr_pfp_path)
+        msg = await update.message.reply_photo(photo=card, caption=text, reply_markup=pager, parse_mode="HTML")
+        remember_card_file_id(card_key, msg)
     except Exception:
+        forget_card_file_id(card_key)
         await update.message.reply_text(text=text, reply_markup=pager, parse_mode="HTML")
 
 
 async def _edit_leaderboard_page(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int):
     query = update.callback_query
     viewer_id = query.from_user.id
-    all_users = get_all_users_sorted()
+    async with db_session():
+        rows, total, page, viewer_row = await asyncio.to_thread(_fetch_leaderboard_page, page, viewer_id)
     text, total_pages, page = _build_leaderboard_text(
-        all_users, page=page, per_page=PER_PAGE, viewer_id=viewer_id
+        rows, total, page=page, per_page=PER_PAGE, viewer_id=viewer_id, viewer_row=viewer_row
     )
 
     # ⚡ FIX: Provide prefix for pager
@@ -268,40 +398,33 @@ async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def leaderboard_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     data = (query.data or "").strip()
+    if not data.startswith("leaderboard_"):
+        return await query.answer()
     try:
-        if not data.startswith("leaderboard_"):
-            return await query.answer()
-        # ⚡ FIX: Read page number correctly
-        page = int(data.split("_", 1)[1])
-        await _edit_leaderboard_page(update, context, page)
-    except (IndexError, ValueError):
-        await query.answer()
+        page = int(data.removeprefix("leaderboard_"))
+    except ValueError:
+        return await query.answer()
+    await _edit_leaderboard_page(update, context, page)
 
 
 # ---------------- DAILY LEADERBOARD ----------------
-from plugins.game.db import get_daily_leaderboard  # fetch daily stats
 
 async def _send_daily_leaderboard_initial(update: Update, context: ContextTypes.DEFAULT_TYPE):
     viewer_id = update.effective_user.id
 
-    # Loading sticker
-    try:
-        mystic = await update.message.reply_sticker(Load_id)
-    except Exception:
-        mystic = await update.message.reply_text("⏳ Loading daily leaderboard...")
+    # Loading sticker goes out while the page is read from the DB
+    loading = asyncio.create_task(_send_loading(update, "⏳ Loading daily leaderboard..."))
 
-    all_users = get_daily_leaderboard()
+    async with db_session():
+        rows, total, page, viewer_row = await asyncio.to_thread(_fetch_leaderboard_page, 1, viewer_id, daily=True)
     text, total_pages, page = _build_leaderboard_text(
-        all_users, page=1, per_page=PER_PAGE, viewer_id=viewer_id, daily=True
+        rows, total, page=page, per_page=PER_PAGE, viewer_id=viewer_id, viewer_row=viewer_row, daily=True
     )
 
     pager = _build_pager_old(page, total_pages, prefix="daily_leaderboard")
 
-    top_user_id = all_users[0]['user_id'] if all_users else viewer_id
-    try:
-        usr_pfp_path = await download_user_photo_by_id(top_user_id, context.bot)
-    except Exception:
-        usr_pfp_path = None
+    top_user_id = rows[0]['user_id'] if rows else viewer_id
+    mystic, usr_pfp_path = await asyncio.gather(loading, _download_photo(top_user_id, context.bot))
 
     # Delete the loading sticker/message
     try:
@@ -309,12 +432,15 @@ async def _send_daily_leaderboard_initial(update: Update, context: ContextTypes.
     except Exception:
         pass
 
+    card_key = None
     try:
-        card = generate_card("daily_leaderboard", usr_pfp_path)
-        await update.message.reply_photo(
+        card_key, card = card_photo("daily_leaderboard", usr_pfp_path)
+        msg = await update.message.reply_photo(
             photo=card, caption=text, reply_markup=pager, parse_mode="HTML"
         )
+        remember_card_file_id(card_key, msg)
     except Exception:
+        forget_card_file_id(card_key)
         await update.message.reply_text(
             text=text, reply_markup=pager, parse_mode="HTML"
         )
@@ -323,11 +449,12 @@ async def _send_daily_leaderboard_initial(update: Update, context: ContextTypes.
 async def _edit_daily_leaderboard_page(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int):
     query = update.callback_query
     viewer_id = query.from_user.id
-    all_users = get_daily_leaderboard()
+    async with db_session():
+        rows, total, page, viewer_row = await asyncio.to_thread(_fetch_leaderboard_page, page, viewer_id, daily=True)
 
     # Build leaderboard text for this page
     text, total_pages, page = _build_leaderboard_text(
-        all_users, page=page, per_page=PER_PAGE, viewer_id=viewer_id, daily=True
+        rows, total, page=page, per_page=PER_PAGE, viewer_id=viewer_id, viewer_row=viewer_row, daily=True
     )
 
     # ⚡ Correct prefix for pager
@@ -352,15 +479,14 @@ async def daily_leaderboard_command(update: Update, context: ContextTypes.DEFAUL
 async def daily_leaderboard_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     data = (query.data or "").strip()
+    if not data.startswith("daily_leaderboard_"):
+        return await query.answer()
     try:
-        if not data.startswith("daily_leaderboard_"):
-            return await query.answer()
-
         # Callback format: "daily_leaderboard_{page}"
-        page = int(data.split("_", 2)[2])
-        await _edit_daily_leaderboard_page(update, context, page)
-    except (IndexError, ValueError):
-        await query.answer()
+        page = int(data.removeprefix("daily_leaderboard_"))
+    except ValueError:
+        return await query.answer()
+    await _edit_daily_leaderboard_page(update, context, page)
 
 async def users_rank(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Determine target user
@@ -371,20 +497,17 @@ async def users_rank(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user_id = user.id
 
-    # Overall stats
-    overall_stats = get_user_rank(user_id)
-
-    # Daily stats
-    from plugins.game.db import get_daily_leaderboard
-    daily_users = get_daily_leaderboard()
-    daily_row = next((row for row in daily_users if row['user_id'] == user_id), None)
+    # Overall + daily stats
+    async with db_session() as conn:
+        overall_stats = await asyncio.to_thread(get_user_rank, user_id)
+        daily_row = await asyncio.to_thread(get_daily_rank_sql, conn, user_id)
     if daily_row:
         daily_games = daily_row['games_played']
         daily_wins = daily_row['wins']
         daily_losses = daily_row['losses']
         daily_score = daily_row['total_score']
         daily_pen = daily_row['penalties']
-        daily_win_pct = round(daily_wins/daily_games*100, 1) if daily_games else 0
+        daily_win_pct = daily_row['win_percent']
     else:
         daily_games = daily_wins = daily_losses = daily_score = daily_pen = daily_win_pct = 0
 
@@ -404,21 +527,9 @@ Rank: {overall_stats['rank']}. {overall_stats['username']}
 """
     await update.message.reply_text(text, parse_mode="HTML")
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import ContextTypes
-from config import Load_id  # This should be the file_id of your loading sticker
-import logging
-
-logger = logging.getLogger(__name__)
-
 async def userinfo(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # Send a loading sticker first
-    try:
-        mystic = await update.message.reply_sticker(Load_id)
-    except Exception:
-        # Fallback to text if sticker fails
-        mystic = await update.message.reply_text("🌸 Loading your stats...")
+    # Loading sticker goes out while the target user and stats are fetched
+    loading = asyncio.create_task(_send_loading(update, "🌸 Loading your stats..."))
 
     # Determine target user
     if update.message.reply_to_message:
@@ -435,37 +546,17 @@ async def userinfo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user_id = user.id
 
-    # Fetch overall stats
-    overall_stats = get_user_rank(user_id)
+    async def fetch_stats():
+        async with db_session():
+            return await asyncio.to_thread(get_user_rank, user_id)
 
-    # Fetch daily stats
-    from plugins.game.db import get_daily_leaderboard
-    daily_users = get_daily_leaderboard()
-    daily_row = next((row for row in daily_users if row['user_id'] == user_id), None)
-    if daily_row:
-        daily_games = daily_row['games_played']
-        daily_wins = daily_row['wins']
-        daily_losses = daily_row['losses']
-        daily_score = daily_row['total_score']
-        daily_pen = daily_row['penalties']
-        daily_win_pct = round(daily_wins/daily_games*100, 1) if daily_games else 0
-    else:
-        daily_games = daily_wins = daily_losses = daily_score = daily_pen = daily_win_pct = 0
+    # Stats and profile pic are independent; fetch them together
+    overall_stats, usr_pfp_path = await asyncio.gather(
+        fetch_stats(), _download_photo(user_id, context.bot)
+    )
 
     # Build message for overall stats
-    overall_msg = f"""
-╭━━━ ⟢ 𝗢𝘃𝗲𝗿𝗮𝗹𝗹 𝗦𝘁𝗮𝘁𝘀 ⟢ ━━━╮
-┃ 👤 <b>{user.first_name}</b>
-╰━━━━━━━━━━━━━━━━━━━╯
-🏆 𝐑𝐚𝐧𝐤: {overall_stats['rank']}
-🎮 Games Played: {overall_stats['total_played']}
-🥇 Wins: {overall_stats['wins']} | Losses: {overall_stats['losses']}
-📊 Win %: {overall_stats['win_percent']:.2f}%
-⭐ Total Score: {overall_stats['total_score']}
-⛔ Penalties: {overall_stats['penalties']}
-━━━━━━━━━━━━━━━━━━━━━
-💡 <i>One match doesn’t define you — the comeback will! 🚀</i>
-"""
+    overall_msg = _USERINFO_FMT.format_map({**overall_stats, "name": user.first_name})
 
     # Inline buttons
     buttons = InlineKeyboardMarkup([
@@ -475,73 +566,55 @@ async def userinfo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ]
     ])
 
-    # Download profile pic for card
-    try:
-        usr_pfp_path = await download_user_photo_by_id(user.id, context.bot)
-    except Exception:
-        logger.exception("Failed to download user photo; using default card background.")
-        usr_pfp_path = None
-
     # Delete the loading sticker or message
+    mystic = await loading
     try:
         await mystic.delete()
     except Exception:
         pass
 
     # Send the final stats
+    card_key = None
     try:
-        card = generate_card("userinfo", usr_pfp_path)
-        await update.message.reply_photo(photo=card, caption=overall_msg, parse_mode="HTML", reply_markup=buttons)
+        card_key, card = card_photo("userinfo", usr_pfp_path)
+        msg = await update.message.reply_photo(photo=card, caption=overall_msg, parse_mode="HTML", reply_markup=buttons)
+        remember_card_file_id(card_key, msg)
     except Exception:
+        forget_card_file_id(card_key)
         await update.message.reply_text(overall_msg, parse_mode="HTML", reply_markup=buttons)
 
 async def userinfo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    data = query.data  # "userinfo_daily_12345" or "userinfo_overall_12345"
-    parts = data.split("_")
-    if len(parts) != 3:
+    data = query.data or ""  # "userinfo_daily_12345" or "userinfo_overall_12345"
+    if not data.startswith("userinfo_"):
         return await query.answer()
 
-    _, view_type, user_id = parts  # Correct: ignore first part "userinfo"
-    user_id = int(user_id)
+    view_type, _, user_id = data.removeprefix("userinfo_").partition("_")
+    try:
+        user_id = int(user_id)
+    except ValueError:
+        return await query.answer()
 
     if view_type == "daily":
-        from plugins.game.db import get_daily_leaderboard
-        daily_users = get_daily_leaderboard()
+        async with db_session() as conn:
+            row = await asyncio.to_thread(get_daily_rank_sql, conn, user_id)
 
-        # Sort by total_score descending to compute rank
-        daily_users_sorted = sorted(daily_users, key=lambda x: x['total_score'], reverse=True)
-        row = next((r for r in daily_users_sorted if r['user_id'] == user_id), None)
         if row:
             games, wins, losses, score, pen = row['games_played'], row['wins'], row['losses'], row['total_score'], row['penalties']
-            win_pct = round(wins/games*100,1) if games else 0
-            # Daily rank
-            rank = daily_users_sorted.index(row) + 1
+            win_pct = row['win_percent']
+            # Daily rank, same ordering as the daily leaderboard
+            rank = row['rnk']
         else:
             games = wins = losses = score = pen = win_pct = rank = 0
 
-        text = f"""
-╭━━━ ⟢ 𝗗𝗮𝗶𝗹𝘆 𝗦𝘁𝗮𝘁𝘀 ⟢ ━━━╮
-🏆 Daily Rank: {rank}
-🎮 Games: {games}
-🥇 Wins: {wins} | Losses: {losses}
-📊 Win %: {win_pct}%
-⭐ Score: {score} | ⛔ Penalties: {pen}
-━━━━━━━━━━━━━━━━━━━━━
-💡 Daily stats keep you motivated! 🚀
-"""
+        text = _DAILY_STATS_FMT.format_map({
+            "rank": rank, "games": games, "wins": wins, "losses": losses,
+            "win_pct": win_pct, "score": score, "pen": pen,
+        })
     else:
-        stats = get_user_rank(user_id)
-        text = f"""
-╭━━━ ⟢ 𝗢𝘃𝗲𝗿𝗮𝗹𝗹 𝗦𝘁𝗮𝘁𝘀 ⟢ ━━━╮
-🏆 Rank: {stats['rank']}
-🎮 Games Played: {stats['total_played']}
-🥇 Wins: {stats['wins']} | Losses: {stats['losses']}
-📊 Win %: {stats['win_percent']:.2f}%
-⭐ Total Score: {stats['total_score']} | ⛔ Penalties: {stats['penalties']}
-━━━━━━━━━━━━━━━━━━━━━
-💡 Track your progress over time! 🚀
-"""
+        async with db_session():
+            stats = await asyncio.to_thread(get_user_rank, user_id)
+        text = _OVERALL_STATS_FMT.format_map(stats)
 
     # Buttons
     buttons = InlineKeyboardMarkup([
@@ -1,137 +1,169 @@
-# plugins/helpers/mods.py
-import sqlite3
-from telegram import Update
-from telegram.ext import CommandHandler, ContextTypes
-from config import DB_PATH, OWNER_ID, LOG_CHAT_ID
+# plugins/helpers/moderators.py
+import re
+import asyncio
 import logging
+from datetime import timedelta
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import CommandHandler, CallbackQueryHandler, ContextTypes
+from config import LOG_CHAT_ID
+from plugins.connections.db import get_conn, transaction
+from plugins.utils.lb_cache import invalidate_leaderboard
+from plugins.helpers.stats import invalidate_stats
+from plugins.utils.decorators import owner_only, mod_or_owner
+from plugins.utils.mods_auth import reload_mods, remember_mod, forget_mod
 
 logger = logging.getLogger(__name__)
 
+# Reset confirmation callback_data: "<action>:<target_id>:<initiator_id>" / "<action>:<initiator_id>"
+_RESET_RE = re.compile(r"^(confirm_reset|cancel_reset):(\d+):(\d+)$")
+_RESET_ALL_RE = re.compile(r"^(confirm_reset_all|cancel_reset_all):(\d+)$")
+
+# Same refusal mod_or_owner gives, rather than owner_only's default
+_NOT_AUTHORIZED = "❌ You are not authorized to use this command."
+
 # ---------------- Database Initialization for Mods ----------------
 def init_mods_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS mods (
-            mod_id INTEGER PRIMARY KEY,
-            username TEXT,
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    with get_conn(readonly=False) as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS mods (
+                mod_id INTEGER PRIMARY KEY,
+                username TEXT,
+                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
         )
-        """
-    )
-    conn.commit()
-    conn.close()
 
 # ---------------- Helper Functions ----------------
-def is_owner(user_id: int) -> bool:
-    """Check if the user is the owner."""
-    return user_id == OWNER_ID
-
-def is_mod(user_id: int) -> bool:
-    """Check if the user is a mod."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT mod_id FROM mods WHERE mod_id = ?", (user_id,))
-    exists = c.fetchone() is not None
-    conn.close()
-    return exists
-
 def add_mod(mod_id: int, username: str) -> bool:
     """Add a mod to the DB if not exists. Returns True if added."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT mod_id FROM mods WHERE mod_id = ?", (mod_id,))
-    if c.fetchone():
-        conn.close()
-        return False  # Already exists
-    c.execute("INSERT INTO mods (mod_id, username) VALUES (?, ?)", (mod_id, username))
-    conn.commit()
-    conn.close()
+    with get_conn(readonly=False) as conn:
+        cur = conn.execute("INSERT OR IGNORE INTO mods (mod_id, username) VALUES (?, ?)", (mod_id, username))
+    if cur.rowcount == 0:
+        return False  # Already a mod
+    remember_mod(mod_id)
     return True
 
 def remove_mod(mod_id: int) -> bool:
     """Remove a mod from the DB. Returns True if removed."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT mod_id FROM mods WHERE mod_id = ?", (mod_id,))
-    if not c.fetchone():
-        conn.close()
-        return False  # Not exists
-    c.execute("DELETE FROM mods WHERE mod_id = ?", (mod_id,))
-    conn.commit()
-    conn.close()
+    with get_conn(readonly=False) as conn:
+        cur = conn.execute("DELETE FROM mods WHERE mod_id = ?", (mod_id,))
+    if cur.rowcount == 0:
+        return False  # Not a mod
+    forget_mod(mod_id)
     return True
 
-def get_all_mods() -> list:
-    """Get list of all mods as (mod_id, username)."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT mod_id, username FROM mods")
-    mods = c.fetchall()
-    conn.close()
-    return mods
+def _mod_list_text() -> str:
+    """/mods lines built straight off the cursor; empty string if there are no mods."""
+    with get_conn() as conn:
+        cur = conn.execute("SELECT mod_id, username FROM mods")
+        return "\n".join(f"{i}. @{username or 'N/A'} (ID: {mod_id})" for i, (mod_id, username) in enumerate(cur, 1))
 
 def reset_user_stats(user_id: int) -> bool:
     """Reset a user's stats in the users table. Returns True if user exists and reset."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
-    if not c.fetchone():
-        conn.close()
-        return False
-    c.execute(
-        """
-        UPDATE users
-        SET games_played = 0,
-            wins = 0,
-            losses = 0,
-            rounds_played = 0,
-            eliminations = 0,
-            total_score = 0,
-            last_score = 0,
-            penalties = 0,
-            updated_at = CURRENT_TIMESTAMP
-        WHERE user_id = ?
-        """,
-        (user_id,)
-    )
-    conn.commit()
-    conn.close()
+    with get_conn(readonly=False) as conn:
+        cur = conn.execute(
+            """
+            UPDATE users
+            SET games_played = 0,
+                wins = 0,
+                losses = 0,
+                rounds_played = 0,
+                eliminations = 0,
+                total_score = 0,
+                last_score = 0,
+                penalties = 0,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = ?
+            """,
+            (user_id,)
+        )
+    if cur.rowcount == 0:
+        return False  # No such user
+    invalidate_leaderboard()
+    invalidate_stats()
     return True
 
+RESET_ALL_CHUNK = 5000
+
+def reset_all_user_stats() -> int:
+    """
+    Reset game stats for every user (accounts are kept) in one transaction,
+    RESET_ALL_CHUNK rows per UPDATE. Rows already at zero are left alone.
+    Returns the number of users reset.
+    """
+    total = 0
+    with transaction() as conn:
+        while True:
+            cur = conn.execute(
+                """
+                UPDATE users
+                SET games_played = 0,
+                    wins = 0,
+                    losses = 0,
+                    rounds_played = 0,
+                    eliminations = 0,
+                    total_score = 0,
+                    last_score = 0,
+                    penalties = 0,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE user_id IN (
+                    SELECT user_id FROM users
+                    WHERE games_played IS NOT 0 OR wins IS NOT 0 OR losses IS NOT 0
+                       OR rounds_played IS NOT 0 OR eliminations IS NOT 0
+                       OR total_score IS NOT 0 OR last_score IS NOT 0 OR penalties IS NOT 0
+                    LIMIT ?
+                )
+                """,
+                (RESET_ALL_CHUNK,)
+            )
+            if cur.rowcount == 0:
+                break
+            total += cur.rowcount
+    invalidate_leaderboard()
+    invalidate_stats()
+    return total
+
+async def _reply_and_log(reply, context: ContextTypes.DEFAULT_TYPE, log_text: str, what: str):
+    """
+    Await the user-facing `reply` coroutine and the LOG_CHAT_ID message together.
+    A failed log send is logged and swallowed; a failed reply still raises.
+    """
+    if not LOG_CHAT_ID:
+        await reply
+        return
+
+    reply_result, log_result = await asyncio.gather(
+        reply, context.bot.send_message(LOG_CHAT_ID, log_text), return_exceptions=True
+    )
+    if isinstance(log_result, BaseException):
+        logger.error("Failed to log %s to LOG_CHAT_ID", what, exc_info=log_result)
+    if isinstance(reply_result, BaseException):
+        raise reply_result
+
 # ---------------- Command Handlers ----------------
+@owner_only(message=_NOT_AUTHORIZED)
 async def addmod(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Owner-only: Add a mod by replying to a user."""
-    user = update.effective_user
-    if not is_owner(user.id):
-        await update.message.reply_text("❌ You are not authorized to use this command.")
-        return
-
     reply = update.message.reply_to_message
     if not reply or not reply.from_user:
         await update.message.reply_text("❌ Reply to a user's message to add them as mod.")
         return
 
     mod_user = reply.from_user
-    if add_mod(mod_user.id, mod_user.username or mod_user.full_name):
-        await update.message.reply_text(f"✅ Added @{mod_user.username or mod_user.full_name} as mod.")
-        # Log to LOG_CHAT_ID if exists
-        if LOG_CHAT_ID:
-            try:
-                await context.bot.send_message(LOG_CHAT_ID, f"🆕 New Mod Added: @{mod_user.username or mod_user.full_name} (ID: {mod_user.id}) by Owner.")
-            except Exception:
-                logger.exception("Failed to log new mod to LOG_CHAT_ID")
+    if await asyncio.to_thread(add_mod, mod_user.id, mod_user.username or mod_user.full_name):
+        await _reply_and_log(
+            update.message.reply_text(f"✅ Added @{mod_user.username or mod_user.full_name} as mod."),
+            context,
+            f"🆕 New Mod Added: @{mod_user.username or mod_user.full_name} (ID: {mod_user.id}) by Owner.",
+            "new mod",
+        )
     else:
         await update.message.reply_text("⚠️ This user is already a mod.")
 
+@owner_only(message=_NOT_AUTHORIZED)
 async def rmmod(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Owner-only: Remove a mod by replying or providing userid."""
-    user = update.effective_user
-    if not is_owner(user.id):
-        await update.message.reply_text("❌ You are not authorized to use this command.")
-        return
-
     mod_id = None
     if context.args:
         try:
@@ -146,103 +178,32 @@ async def rmmod(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Provide a user ID or reply to a user's message to remove mod.")
         return
 
-    if remove_mod(mod_id):
-        await update.message.reply_text(f"✅ Removed mod with ID {mod_id}.")
-        if LOG_CHAT_ID:
-            try:
-                await context.bot.send_message(LOG_CHAT_ID, f"❌ Mod Removed: ID {mod_id} by Owner.")
-            except Exception:
-                logger.exception("Failed to log mod removal to LOG_CHAT_ID")
+    if await asyncio.to_thread(remove_mod, mod_id):
+        await _reply_and_log(
+            update.message.reply_text(f"✅ Removed mod with ID {mod_id}."),
+            context,
+            f"❌ Mod Removed: ID {mod_id} by Owner.",
+            "mod removal",
+        )
     else:
         await update.message.reply_text("⚠️ No such mod found.")
 
+@owner_only(message=_NOT_AUTHORIZED)
 async def mods(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Owner-only: List all mods."""
-    user = update.effective_user
-    if not is_owner(user.id):
-        await update.message.reply_text("❌ You are not authorized to use this command.")
-        return
-
-    mod_list = get_all_mods()
-    if not mod_list:
+    rows = await asyncio.to_thread(_mod_list_text)
+    if not rows:
         await update.message.reply_text("❌ No mods added yet.")
         return
 
-    text = "📋 List of Mods:\n\n"
-    for i, (mod_id, username) in enumerate(mod_list, 1):
-        text += f"{i}. @{username or 'N/A'} (ID: {mod_id})\n"
+    text = "📋 List of Mods:\n\n" + rows
 
     await update.message.reply_text(text)
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import CommandHandler, CallbackQueryHandler, ContextTypes
-import sqlite3
-import logging
-from config import DB_PATH, OWNER_ID, LOG_CHAT_ID
-
-logger = logging.getLogger(__name__)
-
-# ---------------- Database Helpers ----------------
-def init_mods_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS mods (
-            mod_id INTEGER PRIMARY KEY,
-            username TEXT,
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """
-    )
-    conn.commit()
-    conn.close()
-
-def is_owner(user_id: int) -> bool:
-    return user_id == OWNER_ID
-
-def is_mod(user_id: int) -> bool:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT mod_id FROM mods WHERE mod_id = ?", (user_id,))
-    exists = c.fetchone() is not None
-    conn.close()
-    return exists
-
-def reset_user_stats(user_id: int) -> bool:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
-    if not c.fetchone():
-        conn.close()
-        return False
-    c.execute(
-        """
-        UPDATE users
-        SET games_played = 0,
-            wins = 0,
-            losses = 0,
-            rounds_played = 0,
-            eliminations = 0,
-            total_score = 0,
-            last_score = 0,
-            penalties = 0,
-            updated_at = CURRENT_TIMESTAMP
-        WHERE user_id = ?
-        """,
-        (user_id,)
-    )
-    conn.commit()
-    conn.close()
-    return True
-
-# ---------------- Command Handlers ----------------
+# ---------------- Reset User Stats ----------------
+@mod_or_owner
 async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    if not (is_owner(user.id) or is_mod(user.id)):
-        await update.message.reply_text("❌ You are not authorized to use this command.")
-        return
-
     target_id = None
     if context.args:
         try:
@@ -272,27 +233,23 @@ async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def reset_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    data = query.data  # e.g., "confirm_reset:12345:67890" or "cancel_reset:12345:67890"
-
-    try:
-        action, target_id, initiator_id = data.split(":")
-        target_id = int(target_id)
-        initiator_id = int(initiator_id)
+    m = _RESET_RE.match(query.data or "")  # e.g., "confirm_reset:12345:67890"
+    if not m:
+        return await query.answer("⚠️ Invalid reset request.", show_alert=True)
+    action, target_id, initiator_id = m.group(1), int(m.group(2)), int(m.group(3))
 
-        if query.from_user.id != initiator_id:
-            return await query.answer("❌ You cannot confirm/cancel this reset.", show_alert=True)
+    if query.from_user.id != initiator_id:
+        return await query.answer("❌ You cannot confirm/cancel this reset.", show_alert=True)
 
+    try:
         if action == "confirm_reset":
-            if reset_user_stats(target_id):
-                await query.message.edit_text(f"✅ Stats for user ID {target_id} have been reset.")
-                if LOG_CHAT_ID:
-                    try:
-                        await context.bot.send_message(
-                            LOG_CHAT_ID,
-                            f"🔄 User Stats Reset: ID {target_id} by @{query.from_user.username or query.from_user.full_name} (ID: {initiator_id})"
-                        )
-                    except Exception:
-                        logger.exception("Failed to log user reset to LOG_CHAT_ID")
+            if await asyncio.to_thread(reset_user_stats, target_id):
+                await _reply_and_log(
+                    query.message.edit_text(f"✅ Stats for user ID {target_id} have been reset."),
+                    context,
+                    f"🔄 User Stats Reset: ID {target_id} by @{query.from_user.username or query.from_user.full_name} (ID: {initiator_id})",
+                    "user reset",
+                )
             else:
                 await query.message.edit_text("⚠️ No such user found.")
         elif action == "cancel_reset":
@@ -303,13 +260,10 @@ async def reset_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.exception("Error handling reset callback")
         await query.answer("⚠️ Something went wrong.", show_alert=True)
 # ---------------- Reset All Users Game Stats ----------------
+@owner_only(message=_NOT_AUTHORIZED)
 async def reset_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Owner-only: Reset all users game stats with confirmation."""
     user = update.effective_user
-    if not is_owner(user.id):
-        await update.message.reply_text("❌ You are not authorized to use this command.")
-        return
-
     # Confirmation buttons
     buttons = InlineKeyboardMarkup([
         [
@@ -319,55 +273,34 @@ async def reset_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ])
 
     await update.message.reply_text(
-        "⚠️ Are you sure you want to reset **all users' game stats**? This cannot be undone!",
+        "⚠️ Are you sure you want to reset <b>all users' game stats</b>? This cannot be undone!",
         reply_markup=buttons,
-        parse_mode="Markdown"
+        parse_mode="HTML"
     )
 
 async def reset_all_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle Yes/No confirmation for resetting all users game stats."""
     query = update.callback_query
-    data = query.data  # e.g., "confirm_reset_all:12345"
-
-    try:
-        action, initiator_id = data.split(":")
-        initiator_id = int(initiator_id)
+    m = _RESET_ALL_RE.match(query.data or "")  # e.g., "confirm_reset_all:12345"
+    if not m:
+        return await query.answer("⚠️ Invalid reset request.", show_alert=True)
+    action, initiator_id = m.group(1), int(m.group(2))
 
-        if query.from_user.id != initiator_id:
-            return await query.answer("❌ You cannot confirm/cancel this reset.", show_alert=True)
+    if query.from_user.id != initiator_id:
+        return await query.answer("❌ You cannot confirm/cancel this reset.", show_alert=True)
 
+    try:
         if action == "confirm_reset_all":
             # Reset only game stats, not user accounts
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-            c.execute(
-                """
-                UPDATE users
-                SET games_played = 0,
-                    wins = 0,
-                    losses = 0,
-                    rounds_played = 0,
-                    eliminations = 0,
-                    total_score = 0,
-                    last_score = 0,
-                    penalties = 0,
-                    updated_at = CURRENT_TIMESTAMP
-                """
+            await asyncio.to_thread(reset_all_user_stats)
+
+            # Confirm to the owner and log to admin chat together
+            await _reply_and_log(
+                query.message.edit_text("✅ All users' game stats have been reset!"),
+                context,
+                f"🔄 All users' game stats have been reset by @{query.from_user.username or query.from_user.full_name} (ID: {initiator_id})",
+                "reset_all",
             )
-            conn.commit()
-            conn.close()
-
-            await query.message.edit_text("✅ All users' game stats have been reset!")
-
-            # Log to admin chat
-            if LOG_CHAT_ID:
-                try:
-                    await context.bot.send_message(
-                        LOG_CHAT_ID,
-                        f"🔄 All users' game stats have been reset by @{query.from_user.username or query.from_user.full_name} (ID: {initiator_id})"
-                    )
-                except Exception:
-                    logger.exception("Failed to log reset_all to LOG_CHAT_ID")
 
         elif action == "cancel_reset_all":
             await query.message.edit_text("❌ Reset all users' game stats was canceled.")
@@ -378,9 +311,17 @@ async def reset_all_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.answer("⚠️ Something went wrong.", show_alert=True)
 
 
-# ---------------- Register Reset All ----------------
+# ---------------- Register ----------------
+async def reload_mods_job(context: ContextTypes.DEFAULT_TYPE):
+    """Pick up mods table changes made outside this process (e.g. a DB restore)."""
+    try:
+        await asyncio.to_thread(reload_mods)
+    except Exception:
+        logger.exception("Failed to reload mods")
+
 def register_mods_handlers(app):
     init_mods_db()
+    reload_mods()
     app.add_handler(CommandHandler("addmod", addmod))
     app.add_handler(CommandHandler("rmmod", rmmod))
     app.add_handler(CommandHandler("mods", mods))
@@ -392,3 +333,11 @@ def register_mods_handlers(app):
     # All-users reset game stats
     app.add_handler(CommandHandler("resetall", reset_all))
     app.add_handler(CallbackQueryHandler(reset_all_callback, pattern="^(confirm_reset_all|cancel_reset_all):"))
+
+    # Keep the in-memory mod set in sync with the DB
+    app.job_queue.run_repeating(
+        reload_mods_job,
+        interval=timedelta(minutes=10),
+        first=timedelta(minutes=10),
+        name="reload_mods_job",
+    )
@@ -1,14 +1,25 @@
-import sqlite3
 import os
+import time
+from html import escape
+import asyncio
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
 from telegram.error import BadRequest
 from datetime import datetime, timedelta, timezone
 from config import DB_PATH
+from plugins.connections.db import get_conn
 from plugins.connections.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+STATS_TTL = 30
+# Raw numbers behind the stats menu; each click only re-formats them
+_STATS_CACHE = {"ts": 0.0, "data": None, "gen": 0}
+
+def invalidate_stats():
+    """Drop the cached stats (call after resetting user stats)."""
+    _STATS_CACHE.update(ts=0.0, data=None, gen=_STATS_CACHE["gen"] + 1)
+
 def stats_buttons():
     """Generate inline buttons for stats categories."""
     return InlineKeyboardMarkup([
@@ -22,11 +33,11 @@ def stats_buttons():
         ],
     ])
 
-async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+def _count_overview():
+    """Totals for the /stats overview (blocking; call via asyncio.to_thread)."""
     total_users = total_groups = total_games = "N/A"
 
-    try:
-        conn = sqlite3.connect(DB_PATH, timeout=10)
+    with get_conn() as conn:
         c = conn.cursor()
 
         try:
@@ -48,7 +59,12 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.error("Error fetching total_games: %s", e)
             total_games = 0
 
-        conn.close()
+    return total_users, total_groups, total_games
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        total_users, total_groups, total_games = await asyncio.to_thread(_count_overview)
 
         overview_text = (
             "<b>Bot Statistics</b>\n\n"
@@ -66,19 +82,34 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Critical error fetching stats. Please try again later.")
 
 
-async def stats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-
-    selected_category = query.data.replace("stats_", "")
-    current_category = context.chat_data.get('current_stats_category')
-    if current_category == selected_category:
-        try:
-            await query.message.reply_text("ℹ️ You're already viewing this stats category.")
-        except Exception:
-            logger.debug("Couldn't notify same category")
-        return
-
+_SUMMARY_SQL = """
+WITH
+  u AS (
+    SELECT COUNT(*) AS total_users,
+           COALESCE(SUM(wins), 0) AS total_wins,
+           COALESCE(SUM(losses), 0) AS total_losses,
+           COALESCE(SUM(games_played), 0) AS total_games,
+           COALESCE(SUM(penalties), 0) AS total_penalties,
+           COALESCE(AVG(total_score), 0) AS avg_score,
+           COALESCE(SUM(updated_at >= :week_ago), 0) AS active_users,
+           COALESCE(SUM(COALESCE(games_played, 0) = 0), 0) AS inactive_users,
+           COALESCE(SUM(created_at >= :week_ago), 0) AS recent_registrations
+    FROM users
+  ),
+  g AS (SELECT COUNT(*) AS total_groups FROM groups),
+  rg AS (SELECT COUNT(*) AS recent_games FROM games WHERE ended_at >= :day_ago)
+SELECT * FROM u, g, rg
+"""
+
+_TOP_PLAYERS_SQL = "SELECT first_name, username, wins FROM users ORDER BY wins DESC, total_score DESC LIMIT 3"
+_MOST_ACTIVE_GROUP_SQL = "SELECT title, group_id, games_played FROM groups ORDER BY games_played DESC LIMIT 1"
+
+def _error_name(e: Exception) -> str:
+    """SQLite's error code name (e.g. SQLITE_BUSY) when available (Python 3.11+)."""
+    return getattr(e, "sqlite_errorname", None) or type(e).__name__
+
+def _collect_stats() -> dict:
+    """Run the stats queries (blocking; call via asyncio.to_thread)."""
     # Defaults
     total_users = total_groups = total_wins = total_losses = total_games = total_penalties = 0
     db_size_mb = storage_percentage = 0.0
@@ -90,152 +121,148 @@ async def stats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     win_rate = 0.0
     recent_registrations = 0
 
+    # DB size (assume 500 MB quota); cached with the rest of the stats
     try:
-        conn = sqlite3.connect(DB_PATH, timeout=10)
-        c = conn.cursor()
-
-        # Counts
-        try:
-            c.execute("SELECT COUNT(*) FROM users")
-            total_users = c.fetchone()[0] or 0
-        except Exception as e:
-            logger.error("Error fetching total_users: %s", e)
-
-        try:
-            c.execute("SELECT COUNT(*) FROM groups")
-            total_groups = c.fetchone()[0] or 0
-        except Exception as e:
-            logger.error("Error fetching total_groups: %s", e)
-
-        # Sums
-        try:
-            c.execute("SELECT COALESCE(SUM(wins),0), COALESCE(SUM(losses),0), COALESCE(SUM(games_played),0), COALESCE(SUM(penalties),0) FROM users")
-            total_wins, total_losses, total_games, total_penalties = c.fetchone()
-        except Exception as e:
-            logger.error("Error fetching user sums: %s", e)
-
-        # DB size (assume 500 MB quota)
-        try:
-            db_size_bytes = os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0
-            db_size_mb = db_size_bytes / (1024 * 1024)
-            storage_percentage = (db_size_mb / 500.0) * 100.0
-        except Exception as e:
-            logger.error("Error fetching DB size: %s", e)
-
-        now_utc = datetime.now(timezone.utc)
-        one_day_ago_str = (now_utc - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
-        seven_days_ago_str = (now_utc - timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S")
-
-        # Active users (updated in last 7 days)
-        try:
-            c.execute("SELECT COUNT(DISTINCT user_id) FROM users WHERE updated_at IS NOT NULL AND updated_at >= ?", (seven_days_ago_str,))
-            active_users = c.fetchone()[0] or 0
-        except Exception as e:
-            logger.error("Error fetching active_users: %s", e)
+        db_size_bytes = os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0
+        db_size_mb = db_size_bytes / (1024 * 1024)
+        storage_percentage = (db_size_mb / 500.0) * 100.0
+    except Exception as e:
+        logger.error("Error fetching DB size: %s", e)
 
-        # Recent games (24h)
-        try:
-            now_utc = datetime.now(timezone.utc)
-            one_day_ago_str = (now_utc - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    # Naive UTC so isoformat() matches the stored 'YYYY-MM-DD HH:MM:SS' (no +00:00)
+    now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
+    one_day_ago_str = (now_utc - timedelta(days=1)).isoformat(sep=" ", timespec="seconds")
+    seven_days_ago_str = (now_utc - timedelta(days=7)).isoformat(sep=" ", timespec="seconds")
 
-            c.execute("SELECT COUNT(*) FROM games WHERE ended_at >= ?", (one_day_ago_str,))
-            recent_games = c.fetchone()[0] or 0
-        except Exception as e:
-            logger.error("Error fetching recent_games: %s", e)
+    with get_conn() as conn:
+        c = conn.cursor()
 
-        # Avg games per user
+        # Counts, sums and activity in one pass over users
         try:
-            avg_games_per_user = (total_games / total_users) if total_users > 0 else 0.0
+            c.execute(_SUMMARY_SQL, {"week_ago": seven_days_ago_str, "day_ago": one_day_ago_str})
+            row = c.fetchone()
+            total_users = row["total_users"]
+            total_groups = row["total_groups"]
+            total_wins = row["total_wins"]
+            total_losses = row["total_losses"]
+            total_games = row["total_games"]
+            total_penalties = row["total_penalties"]
+            avg_score = row["avg_score"]
+            active_users = row["active_users"]
+            inactive_users = row["inactive_users"]
+            recent_registrations = row["recent_registrations"]
+            recent_games = row["recent_games"]
         except Exception as e:
-            logger.error("Error calculating avg_games_per_user: %s", e)
+            logger.error("Error fetching stats summary (%s): %s", _error_name(e), e)
 
-        # Top players
+        # Top lists: top players + most active group
         try:
-            c.execute("SELECT first_name, username, wins FROM users ORDER BY wins DESC, total_score DESC LIMIT 3")
+            c.execute(_TOP_PLAYERS_SQL)
             rows = c.fetchall()
             if rows:
                 lines = []
                 for i, (first_name, username, wins) in enumerate(rows, start=1):
-                    name = (first_name or "Player").replace("<","&lt;").replace(">","&gt;")
+                    name = escape(first_name or "Player", quote=False)
                     handle = f" (@{username})" if username else ""
                     lines.append(f"{i}. {name}{handle} - {wins} wins")
                 top_players_info = "\n".join(lines)
             else:
                 top_players_info = "No players with wins yet."
-        except Exception as e:
-            logger.error("Error fetching top_players: %s", e)
-            top_players_info = "N/A"
-
-        # Average score
-        try:
-            c.execute("SELECT COALESCE(AVG(total_score),0) FROM users")
-            avg_score = c.fetchone()[0] or 0.0
-        except Exception as e:
-            logger.error("Error fetching avg_score: %s", e)
 
-        # Most active group
-        try:
-            c.execute("SELECT title, group_id, games_played FROM groups ORDER BY games_played DESC LIMIT 1")
+            c.execute(_MOST_ACTIVE_GROUP_SQL)
             most_active_group = c.fetchone()
             if most_active_group and (most_active_group[2] or 0) > 0:
-                gtitle = (most_active_group[0] or "Unknown").replace("<","&lt;").replace(">","&gt;")
+                gtitle = escape(most_active_group[0] or "Unknown", quote=False)
                 most_active_group_info = f"{gtitle} (ID: {most_active_group[1]}, Games: {most_active_group[2]})"
             else:
                 most_active_group_info = "No games played yet."
         except Exception as e:
-            logger.error("Error fetching most_active_group: %s", e)
-            most_active_group_info = "N/A"
+            logger.error("Error fetching stats top lists (%s): %s", _error_name(e), e)
+            top_players_info = most_active_group_info = "N/A"
+
+    avg_games_per_user = (total_games / total_users) if total_users > 0 else 0.0
+    win_rate = (total_wins / total_games * 100.0) if total_games > 0 else 0.0
+
+    return {
+        "total_users": total_users,
+        "total_groups": total_groups,
+        "total_wins": total_wins,
+        "total_losses": total_losses,
+        "total_games": total_games,
+        "total_penalties": total_penalties,
+        "db_size_mb": db_size_mb,
+        "storage_percentage": storage_percentage,
+        "active_users": active_users,
+        "recent_games": recent_games,
+        "avg_games_per_user": avg_games_per_user,
+        "avg_score": avg_score,
+        "top_players_info": top_players_info,
+        "most_active_group_info": most_active_group_info,
+        "inactive_users": inactive_users,
+        "win_rate": win_rate,
+        "recent_registrations": recent_registrations,
+    }
+
+
+async def _get_stats() -> dict:
+    now = time.monotonic()
+    if _STATS_CACHE["data"] is not None and now - _STATS_CACHE["ts"] < STATS_TTL:
+        return _STATS_CACHE["data"]
+
+    gen = _STATS_CACHE["gen"]
+    data = await asyncio.to_thread(_collect_stats)
+    # Don't keep numbers that were read before a reset
+    if gen == _STATS_CACHE["gen"]:
+        _STATS_CACHE.update(ts=now, data=data)
+    return data
 
-        try:
-            c.execute("SELECT COUNT(*) FROM users WHERE COALESCE(games_played,0) = 0")
-            inactive_users = c.fetchone()[0] or 0
-        except Exception as e:
-            logger.error("Error fetching inactive_users: %s", e)
 
-        try:
-            win_rate = (total_wins / total_games * 100.0) if total_games > 0 else 0.0
-        except Exception as e:
-            logger.error("Error calculating win_rate: %s", e)
+async def stats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
 
-        try:
-            c.execute("SELECT COUNT(*) FROM users WHERE created_at IS NOT NULL AND created_at >= ?", (seven_days_ago_str,))
-            recent_registrations = c.fetchone()[0] or 0
-        except Exception as e:
-            logger.error("Error fetching recent_registrations: %s", e)
+    selected_category = query.data.replace("stats_", "")
+    current_category = context.chat_data.get('current_stats_category')
+    if current_category == selected_category:
+        # Toast on the button instead of posting a new message
+        await query.answer("ℹ️ Already viewing this.", show_alert=False)
+        return
+
+    await query.answer()
 
-        conn.close()
+    try:
+        s = await _get_stats()
 
         if selected_category == "bot":
             text = (
                 "<b>Bot Stats</b>\n\n"
-                f"💾 Storage: {db_size_mb:.2f} MB ({storage_percentage:.1f}% of 500 MB)\n"
-                f"🎮 Total Games: {total_games}\n"
-                f"🏆 Win Rate: {win_rate:.1f}%"
+                f"💾 Storage: {s['db_size_mb']:.2f} MB ({s['storage_percentage']:.1f}% of 500 MB)\n"
+                f"🎮 Total Games: {s['total_games']}\n"
+                f"🏆 Win Rate: {s['win_rate']:.1f}%"
             )
         elif selected_category == "users":
             text = (
                 "<b>User Stats</b>\n\n"
-                f"👥 Total Users: {total_users}\n"
-                f"🕒 Active Users (7 days): {active_users}\n"
-                f"😴 Inactive Users: {inactive_users}\n"
-                f"🆕 New Users (7 days): {recent_registrations}\n"
-                f"🎮 Avg. Games/User: {avg_games_per_user:.1f}\n"
-                f"📊 Avg. Score: {avg_score:.1f}"
+                f"👥 Total Users: {s['total_users']}\n"
+                f"🕒 Active Users (7 days): {s['active_users']}\n"
+                f"😴 Inactive Users: {s['inactive_users']}\n"
+                f"🆕 New Users (7 days): {s['recent_registrations']}\n"
+                f"🎮 Avg. Games/User: {s['avg_games_per_user']:.1f}\n"
+                f"📊 Avg. Score: {s['avg_score']:.1f}"
             )
         elif selected_category == "groups":
             text = (
                 "<b>Group Stats</b>\n\n"
-                f"🏘 Total Groups: {total_groups}\n"
-                f"🔥 Active Groups (24h): {recent_games}\n"
-                f"🏆 Most Active Group: {most_active_group_info}"
+                f"🏘 Total Groups: {s['total_groups']}\n"
+                f"🔥 Active Groups (24h): {s['recent_games']}\n"
+                f"🏆 Most Active Group: {s['most_active_group_info']}"
             )
         elif selected_category == "top_players":
             text = (
                 "<b>Top 3 Players</b>\n\n"
-                f"{top_players_info}\n\n"
-                f"⚠️ Total Penalties: {total_penalties}\n"
-                f"🏆 Total Wins: {total_wins}\n"
-                f"❌ Total Losses: {total_losses}"
+                f"{s['top_players_info']}\n\n"
+                f"⚠️ Total Penalties: {s['total_penalties']}\n"
+                f"🏆 Total Wins: {s['total_wins']}\n"
+                f"❌ Total Losses: {s['total_losses']}"
             )
         else:
             text = "❌ Unknown category"
@@ -247,10 +274,6 @@ async def stats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except BadRequest as e:
         if "Message is not modified" in str(e):
             logger.debug("Message not modified for category %s", selected_category)
-            try:
-                await query.message.reply_text("ℹ️ You're already viewing this stats category.")
-            except Exception:
-                logger.debug("Can't send same-category message")
         else:
             logger.exception("BadRequest in stats_callback: %s", e)
             await query.message.reply_text("❌ Error updating stats. Try again later.")
@@ -291,6 +314,6 @@ async def getid_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     await update.message.reply_text(
-        f"📌 {file_type} File ID:\n`{file_id}`", parse_mode="Markdown"
+        f"📌 {file_type} File ID:\n<code>{escape(file_id)}</code>", parse_mode="HTML"
     )
 
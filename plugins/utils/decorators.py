@@ -1,7 +1,7 @@
 from functools import wraps
 from telegram import Update
 from telegram.ext import ContextTypes
-from plugins.helpers.moderators import is_owner, is_mod
+from plugins.utils.mods_auth import is_owner, is_mod
 
 def admin_only(func):
     @wraps(func)
@@ -24,13 +24,19 @@ def admin_only(func):
     return wrapped
 
 
-def owner_only(func):
-    """Allow only the OWNER_ID to execute the command."""
+def owner_only(func=None, *, message: str = "❌ Sorry Baccha, Ap owner nhi 😓"):
+    """
+    Allow only the OWNER_ID to execute the command.
+    Use as @owner_only, or @owner_only(message=...) for a different refusal.
+    """
+    if func is None:
+        return lambda f: owner_only(f, message=message)
+
     @wraps(func)
     async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user = update.effective_user
         if not user or not is_owner(user.id):
-            await update.message.reply_text("❌ Sorry Baccha, Ap owner nhi 😓")
+            await update.message.reply_text(message)
             return
         return await func(update, context, *args, **kwargs)
     return wrapped
@@ -0,0 +1,78 @@
+import time
+import threading
+from concurrent.futures import Future
+from functools import wraps
+
+# key -> (expires_at, rows)
+_store: dict = {}
+# key -> Future of the query currently running for that key
+_inflight: dict = {}
+_lock = threading.Lock()
+_generation = 0
+
+
+def _freeze(rows):
+    """Turn sqlite rows into a tuple of plain dicts so it can be shared safely."""
+    return tuple(dict(row) for row in rows)
+
+
+def cached(key_fn, ttl: float = 30):
+    """
+    Cache a leaderboard fetcher's result for `ttl` seconds.
+    `key_fn` receives the wrapped function's arguments and returns the cache key.
+    Row lists are frozen with _freeze(); scalars (e.g. counts) are stored as-is.
+
+    Concurrent misses on the same key are single-flighted: the first caller
+    runs the query and the others wait for its result.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            key = key_fn(*args, **kwargs)
+            now = time.monotonic()
+            with _lock:
+                hit = _store.get(key)
+                if hit and hit[0] > now:
+                    return hit[1]
+                fut = _inflight.get(key)
+                if fut is None:
+                    fut = _inflight[key] = Future()
+                    owner = True
+                    generation = _generation
+                else:
+                    owner = False
+
+            if not owner:
+                return fut.result()
+
+            try:
+                rows = func(*args, **kwargs)
+                if isinstance(rows, list):
+                    rows = _freeze(rows)
+            except BaseException as e:
+                with _lock:
+                    if _inflight.get(key) is fut:
+                        del _inflight[key]
+                fut.set_exception(e)
+                raise
+
+            with _lock:
+                if _inflight.get(key) is fut:
+                    del _inflight[key]
+                # Don't store a result that was read before an invalidation
+                if generation == _generation:
+                    _store[key] = (now + ttl, rows)
+            fut.set_result(rows)
+            return rows
+        return wrapped
+    return decorator
+
+
+def invalidate_leaderboard():
+    """Drop every cached leaderboard result (call after score/win updates)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _store.clear()
+        # Later callers must not join queries that started before the write
+        _inflight.clear()
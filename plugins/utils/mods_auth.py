@@ -0,0 +1,32 @@
+from config import OWNER_ID
+from plugins.connections.db import get_conn
+
+# In-memory copy of the mods table; is_mod() checks this instead of the DB
+_MOD_IDS: frozenset[int] = frozenset()
+
+
+def is_owner(user_id: int) -> bool:
+    """Check if the user is the owner."""
+    return user_id == OWNER_ID
+
+
+def is_mod(user_id: int) -> bool:
+    """Check if the user is a mod."""
+    return user_id in _MOD_IDS
+
+
+def reload_mods():
+    """Reload the in-memory mod set from the mods table."""
+    global _MOD_IDS
+    with get_conn() as conn:
+        _MOD_IDS = frozenset(row[0] for row in conn.execute("SELECT mod_id FROM mods"))
+
+
+def remember_mod(mod_id: int):
+    global _MOD_IDS
+    _MOD_IDS = _MOD_IDS | {mod_id}
+
+
+def forget_mod(mod_id: int):
+    global _MOD_IDS
+    _MOD_IDS = _MOD_IDS - {mod_id}
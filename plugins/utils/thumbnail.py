@@ -1,5 +1,7 @@
 from PIL import Image, ImageDraw
 from pathlib import Path
+from collections import OrderedDict
+from hashlib import blake2b
 from telegram import User
 from telegram.error import TelegramError
 import io
@@ -21,6 +23,13 @@ TEMPLATES = {
 }
 
 TEMP_DIR = Path("temp")
+CARD_CACHE_DIR = TEMP_DIR / "card_cache"
+CARD_CACHE_SIZE = 64
+
+# Most recently used card keys last; evicted keys get their PNG deleted
+_card_lru: OrderedDict[str, Path] = OrderedDict()
+# Telegram file_id of each cached card once it has been sent
+_card_file_ids: dict[str, str] = {}
 
 async def download_user_photo_by_id(user_id: int, bot):
     try:
@@ -65,3 +74,63 @@ def generate_card(template_name, user_pfp=None):
     base.save(bio, "PNG")
     bio.seek(0)
     return bio
+
+
+def card_cache_key(template_name, user_pfp=None):
+    """Key a card by template and the photo's contents (the photo path is reused per user)."""
+    h = blake2b(template_name.encode(), digest_size=16)
+    with open(user_pfp, "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+def generate_card_cached(template_name, user_pfp=None, key=None):
+    """generate_card(), but reuse the PNG from disk when the same card was built recently."""
+    if not (user_pfp and os.path.exists(user_pfp)):
+        return generate_card(template_name, user_pfp)
+
+    key = key or card_cache_key(template_name, user_pfp)
+    path = _card_lru.get(key)
+    if path is not None:
+        try:
+            bio = io.BytesIO(path.read_bytes())
+            bio.name = "card.png"
+            _card_lru.move_to_end(key)
+            return bio
+        except OSError:
+            # temp/ is wiped periodically; rebuild below
+            del _card_lru[key]
+
+    bio = generate_card(template_name, user_pfp)
+    CARD_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = CARD_CACHE_DIR / f"{key}.png"
+    path.write_bytes(bio.getvalue())
+    _card_lru[key] = path
+    while len(_card_lru) > CARD_CACHE_SIZE:
+        old_key, old = _card_lru.popitem(last=False)
+        _card_file_ids.pop(old_key, None)
+        old.unlink(missing_ok=True)
+    return bio
+
+def card_photo(template_name, user_pfp=None):
+    """
+    Return (key, photo) for reply_photo: the Telegram file_id if this exact
+    card was sent before, otherwise the PNG. `key` is None without a photo.
+    """
+    if not (user_pfp and os.path.exists(user_pfp)):
+        return None, generate_card(template_name, user_pfp)
+
+    key = card_cache_key(template_name, user_pfp)
+    file_id = _card_file_ids.get(key)
+    if file_id:
+        if key in _card_lru:
+            _card_lru.move_to_end(key)
+        return key, file_id
+    return key, generate_card_cached(template_name, user_pfp, key=key)
+
+def remember_card_file_id(key, message):
+    """Store the file_id Telegram assigned to a sent card so the next send skips the upload."""
+    if key and message and message.photo:
+        _card_file_ids[key] = message.photo[-1].file_id
+
+def forget_card_file_id(key):
+    _card_file_ids.pop(key, None)